@@ -1,19 +1,25 @@
 import streamlit as st
-import pandas as pd
-import time
+import streamlit.components.v1 as components
 import os
+import re
+import json
+import time
+import sqlite3
 import base64
+import hashlib
 import requests
+from requests.adapters import HTTPAdapter
+import threading
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from email.utils import parseaddr
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
+from email.message import EmailMessage, MIMEPart
 
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from groq import Groq
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit_autorefresh import st_autorefresh
 
 # ==========================================
 # ⚙️ 設定・初期化
@@ -34,6 +40,26 @@ GROQ_API_KEY = get_secret("GROQ_API_KEY")
 LINE_CHANNEL_ACCESS_TOKEN = get_secret("LINE_CHANNEL_ACCESS_TOKEN")
 LINE_USER_ID = get_secret("LINE_USER_ID")
 
+# 自動送信メールとみなす送信元キーワード
+SPAM_RE = re.compile(r"no-?reply|mailer-daemon|google|amazon|rakuten|unknown", re.IGNORECASE)
+
+# 要約に渡す本文の最大文字数と、除去する引用行・署名区切り
+MAX_SUMMARY_CHARS = 4000
+QUOTE_RE = re.compile(r"^>.*(?:\r?\n|$)", re.MULTILINE)
+SIGNATURE_RE = re.compile(r"^-- \r?$", re.MULTILINE)
+
+# Gmail API のタイムアウト（秒）
+GMAIL_TIMEOUT = 30
+
+# 処理ログの最大保持件数と、処理済みメールIDの保持期間（秒）
+LOG_MAXLEN = 500
+SEEN_TTL = 30 * 24 * 60 * 60
+
+# LINE API 用のセッション（TLS接続を使い回す）
+_LINE_SESSION = requests.Session()
+_LINE_SESSION.headers.update({"Content-Type": "application/json"})
+_LINE_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
 # token.jsonの復元（クラウド対応）
 if not os.path.exists("token.json"):
     if "GOOGLE_TOKEN_JSON" in st.secrets:
@@ -66,158 +92,507 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# 再起動をまたいで状態を保持する SQLite（返信数・ログ・次回時刻・処理済みID）
+@st.cache_resource
+def get_state_db():
+    conn = sqlite3.connect("state.db", check_same_thread=False)
+    conn.execute("CREATE TABLE IF NOT EXISTS state(k TEXT PRIMARY KEY, v BLOB)")
+    conn.execute("CREATE TABLE IF NOT EXISTS seen(msg_id TEXT PRIMARY KEY, ts INTEGER)")
+    conn.execute("CREATE TABLE IF NOT EXISTS log(id INTEGER PRIMARY KEY AUTOINCREMENT, entry TEXT)")
+    # 30日より古い処理済みIDは削除
+    conn.execute("DELETE FROM seen WHERE ts < ?", (int(time.time()) - SEEN_TTL,))
+    conn.commit()
+    return conn, threading.Lock()
+
+def load_state(key, default):
+    conn, lock = get_state_db()
+    with lock:
+        row = conn.execute("SELECT v FROM state WHERE k = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+def save_state(key, value):
+    conn, lock = get_state_db()
+    with lock:
+        conn.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+        conn.commit()
+
+def mark_seen(msg_id):
+    # 新規なら True、すでに処理済みなら False
+    conn, lock = get_state_db()
+    with lock:
+        cur = conn.execute("INSERT OR IGNORE INTO seen VALUES (?, ?)", (msg_id, int(time.time())))
+        conn.commit()
+    return cur.rowcount == 1
+
+# 返信数とログは全セッションで共有する（各セッションの値で上書きしない）
+def get_reply_count():
+    saved = load_state("reply_count", None)
+    if isinstance(saved, dict) and saved.get("date") == datetime.now().strftime("%Y-%m-%d"):
+        return saved["count"]
+    return 0
+
+def add_reply_count(n):
+    # 読み出しと書き込みを同じロック内で行い、日付が変わっていれば0から数え直す
+    today = datetime.now().strftime("%Y-%m-%d")
+    conn, lock = get_state_db()
+    with lock:
+        row = conn.execute("SELECT v FROM state WHERE k = 'reply_count'").fetchone()
+        saved = json.loads(row[0]) if row else None
+        count = saved["count"] if isinstance(saved, dict) and saved.get("date") == today else 0
+        value = json.dumps({"date": today, "count": count + n})
+        conn.execute("INSERT OR REPLACE INTO state VALUES ('reply_count', ?)", (value,))
+        conn.commit()
+
+def add_log(entry):
+    conn, lock = get_state_db()
+    with lock:
+        conn.execute("INSERT INTO log(entry) VALUES (?)", (json.dumps(entry, ensure_ascii=False),))
+        conn.execute("DELETE FROM log WHERE id <= (SELECT MAX(id) FROM log) - ?", (LOG_MAXLEN,))
+        conn.commit()
+
+def clear_log():
+    conn, lock = get_state_db()
+    with lock:
+        conn.execute("DELETE FROM log")
+        conn.commit()
+
+def sync_log():
+    # ほかのセッションが追加した分も含め、DBが更新されていればログを読み直す
+    conn, lock = get_state_db()
+    with lock:
+        latest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM log").fetchone()[0]
+        if latest == st.session_state.get("log_version"):
+            return
+        rows = conn.execute("SELECT entry FROM log ORDER BY id DESC LIMIT ?", (LOG_MAXLEN,)).fetchall()
+    st.session_state.log_data = deque((json.loads(r[0]) for r in rows), maxlen=LOG_MAXLEN)
+    st.session_state.log_version = latest
+
+def save_next_run_time(value):
+    st.session_state.next_run_time = value
+    save_state("next_run_time", value.isoformat() if value else None)
+
 # セッション初期化
-if "reply_count" not in st.session_state:
-    st.session_state.reply_count = 0
-if "log_data" not in st.session_state:
-    st.session_state.log_data = []
+if "is_active" not in st.session_state:
+    st.session_state.is_active = load_state("is_active", False)
 if "next_run_time" not in st.session_state:
-    st.session_state.next_run_time = None
+    saved = load_state("next_run_time", None)
+    st.session_state.next_run_time = datetime.fromisoformat(saved) if saved else None
 
 # ==========================================
 # 🛠️ 関数定義
 # ==========================================
 
+def log_df():
+    # ログが変わったときだけ DataFrame を作り直す（カウントダウン中の毎秒の再実行対策）
+    cached = st.session_state.get("log_df")
+    if cached is None or cached[0] != st.session_state.log_version:
+        import pandas as pd
+        cached = (st.session_state.log_version, pd.DataFrame(list(st.session_state.log_data)))
+        st.session_state.log_df = cached
+    return cached[1]
+
+@st.cache_resource
+def get_gmail_credentials():
+    # Google系ライブラリは読み込みが重いので、使うときに import する
+    from google.oauth2.credentials import Credentials
+    return Credentials.from_authorized_user_file("token.json")
+
+def new_gmail_http():
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    return AuthorizedHttp(get_gmail_credentials(), http=httplib2.Http(timeout=GMAIL_TIMEOUT))
+
+@st.cache_resource
+def get_gmail_service():
+    from googleapiclient.discovery import build
+    # discovery の解析は重いので、サービスは再実行をまたいで使い回す（接続もキープアライブで再利用）
+    return build("gmail", "v1", http=new_gmail_http(), cache_discovery=False)
+
+@st.cache_resource
+def get_gmail_lock():
+    return threading.Lock()
+
+@st.cache_resource
+def get_gmail_http_pool():
+    # 並列送信用の接続プール。httplib2 はスレッドセーフでないため1スレッド1接続で貸し出す
+    return queue.SimpleQueue()
+
+@st.cache_resource
 def init_groq():
     if not GROQ_API_KEY:
         return None
     try:
+        from groq import Groq
         return Groq(api_key=GROQ_API_KEY)
     except:
         return None
 
-def summarize(text, client):
-    if not client or not text:
-        return "（要約不可）"
+def summary_messages(text):
+    return [
+        {"role": "system", "content": "メールの要約を日本語で3行で作成してください。"},
+        {"role": "user", "content": text}
+    ]
+
+def stream_summary(text, client):
+    # ストリーミングで受け取り、3行そろった時点で打ち切る
+    resp = client.chat.completions.create(
+        model="llama-3.3-70b-versatile",
+        messages=summary_messages(text),
+        temperature=0.5,
+        max_tokens=200,
+        stream=True
+    )
+    out = ""
     try:
-        resp = client.chat.completions.create(
+        for chunk in resp:
+            out += chunk.choices[0].delta.content or ""
+            # 改行まで届いた行のうち、空行と前置き（「以下は要約です：」等）を除いて数える
+            if len(summary_lines(out.split("\n")[:-1])) >= 3:
+                break
+    finally:
+        resp.close()
+    return "\n".join(summary_lines(out.split("\n"))[:3]) or out.strip()
+
+def summary_lines(lines):
+    lines = [l for l in lines if l.strip()]
+    if lines and lines[0].rstrip().endswith((":", "：")):
+        lines = lines[1:]
+    return lines
+
+@st.cache_data(ttl=86400, max_entries=1024, show_spinner=False)
+def summarize_cached(body_hash, _text, _client):
+    # 本文のハッシュをキーに要約をキャッシュ（例外はキャッシュされない）
+    try:
+        return stream_summary(_text, _client)
+    except Exception:
+        resp = _client.chat.completions.create(
             model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "メールの要約を日本語で3行で作成してください。"},
-                {"role": "user", "content": text}
-            ],
+            messages=summary_messages(_text),
             temperature=0.5,
             max_tokens=300
         )
         return resp.choices[0].message.content
+
+def summarize(text, client):
+    if not client or not text:
+        return "（要約不可）"
+    # 引用行と署名を除き、長すぎる本文は切り詰めてトークン数を抑える
+    text = SIGNATURE_RE.split(QUOTE_RE.sub("", text), 1)[0].strip() or text
+    if len(text) > MAX_SUMMARY_CHARS:
+        text = text[:MAX_SUMMARY_CHARS] + "…"
+    try:
+        body_hash = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        return summarize_cached(body_hash, text, client)
     except Exception as e:
         return f"AIエラー: {e}"
 
 def line_push_message(text):
+    return line_push_batch([text])
+
+def line_push_batch(texts):
+    # push API は1リクエストで最大5件のメッセージを送れる
     if not LINE_CHANNEL_ACCESS_TOKEN or not LINE_USER_ID:
         st.error("⚠️ LINE設定エラー")
         return False
 
     url = "https://api.line.me/v2/bot/message/push"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"
-    }
+    headers = {"Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"}
     data = {
         "to": LINE_USER_ID,
-        "messages": [{"type": "text", "text": text}]
+        "messages": [{"type": "text", "text": t} for t in texts]
     }
-    resp = requests.post(url, headers=headers, json=data)
+    try:
+        resp = _LINE_SESSION.post(url, headers=headers, json=data, timeout=5)
+    except requests.RequestException as e:
+        st.error(f"LINE送信エラー({e})")
+        return False
     
     if resp.status_code != 200:
         st.error(f"LINE送信エラー({resp.status_code})")
         return False
     return True
 
-def create_reply(to_addr_full, subject, thread_id, message_id_reply, reply_subject, reply_body, pdf_bytes, pdf_filename):
+def create_pdf_part(pdf_bytes, pdf_filename):
+    # PDFのbase64エンコードは1回だけ行い、全返信で同じパートを使い回す
+    if not pdf_bytes or not pdf_filename:
+        return None
+    pdf = MIMEPart()
+    pdf.set_content(pdf_bytes, maintype="application", subtype="pdf", filename=pdf_filename)
+    return pdf
+
+def create_reply(to_addr_full, subject, thread_id, message_id_reply, reply_subject, reply_body, pdf_part):
+    # pdf_part は複数の返信で共有されるため変更しないこと
     _, clean_addr = parseaddr(to_addr_full)
-    msg = MIMEMultipart()
-    msg["to"] = clean_addr
+    msg = EmailMessage()
+    msg["To"] = clean_addr
     
     if reply_subject:
-        msg["subject"] = reply_subject
+        msg["Subject"] = reply_subject
     else:
-        msg["subject"] = subject if subject.startswith("Re:") else f"Re: {subject}"
+        msg["Subject"] = subject if subject.startswith("Re:") else f"Re: {subject}"
         
     msg["In-Reply-To"] = message_id_reply
     msg["References"] = message_id_reply
 
-    msg.attach(MIMEText(reply_body, "plain"))
+    msg.set_content(reply_body)
 
-    if pdf_bytes and pdf_filename:
-        pdf = MIMEApplication(pdf_bytes, _subtype="pdf")
-        pdf.add_header("Content-Disposition", "attachment", filename=pdf_filename)
-        msg.attach(pdf)
+    if pdf_part is not None:
+        msg.make_mixed()
+        msg.attach(pdf_part)
 
-    return {"raw": base64.urlsafe_b64encode(msg.as_bytes()).decode(), "threadId": thread_id}
+    return {"raw": base64.urlsafe_b64encode(bytes(msg)).decode("ascii"), "threadId": thread_id}
 
 def get_body(payload):
-    body = ""
-    if "parts" in payload:
-        for part in payload["parts"]:
-            if part["mimeType"] == "text/plain":
-                if "data" in part["body"]:
-                    body += base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="ignore")
-            elif "parts" in part:
-                body += get_body(part)
-    else:
-        if "body" in payload and "data" in payload["body"]:
-            body += base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8", errors="ignore")
-    return body
+    # 再帰せずスタックでパートを辿り、最後に一度だけ結合・デコードする
+    if "parts" not in payload:
+        data = payload.get("body", {}).get("data")
+        return base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore") if data else ""
+
+    chunks = []
+    stack = list(reversed(payload["parts"]))
+    while stack:
+        part = stack.pop()
+        if part.get("mimeType") == "text/plain":
+            data = part.get("body", {}).get("data")
+            if data:
+                chunks.append(base64.urlsafe_b64decode(data))
+        elif "parts" in part:
+            stack.extend(reversed(part["parts"]))
+    return b"".join(chunks).decode("utf-8", errors="ignore")
+
+def batch_get_messages(service, ids, **kwargs):
+    # messages.get をまとめて1回のバッチリクエストで取得（1バッチ最大100件）
+    results = {}
+
+    def cb(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    for i in range(0, len(ids), 100):
+        batch = service.new_batch_http_request()
+        for msg_id in ids[i:i + 100]:
+            batch.add(service.users().messages().get(userId="me", id=msg_id, **kwargs), request_id=msg_id, callback=cb)
+        batch.execute()
+    return results
+
+def search_unread(service):
+    # 未読メールのIDをすべて取得する（上限を超えた分は次回以降に持ち越す）
+    messages = []
+    page_token = None
+    while True:
+        results = service.users().messages().list(userId="me", q="is:unread", maxResults=500, pageToken=page_token).execute()
+        messages += results.get("messages", [])
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    return messages
+
+def list_new_messages(service, max_emails):
+    # 前回の historyId からの差分だけを取得する（初回・期限切れ時は未読検索）
+    # 戻り値は (今回処理するメール, 処理後に save_cursor で保存するカーソル)
+    from googleapiclient.errors import HttpError
+    last_history_id = load_state("last_history_id", None)
+    if last_history_id is None:
+        profile = service.users().getProfile(userId="me").execute()
+        candidates = search_unread(service)
+        return candidates[:max_emails], {"history_id": profile["historyId"], "pending": candidates[max_emails:]}
+
+    added = []
+    page_token = None
+    try:
+        while True:
+            hist = service.users().history().list(
+                userId="me", startHistoryId=last_history_id, historyTypes=["messageAdded"],
+                labelId="UNREAD", pageToken=page_token
+            ).execute()
+            for h in hist.get("history", []):
+                for a in h.get("messagesAdded", []):
+                    added.append({"id": a["message"]["id"], "threadId": a["message"]["threadId"]})
+            page_token = hist.get("nextPageToken")
+            if not page_token:
+                break
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+        # historyId が古すぎる場合は取り直す
+        save_state("last_history_id", None)
+        return list_new_messages(service, max_emails)
+
+    # 件数上限を超えた分は次回に回す
+    candidates = list({m["id"]: m for m in load_state("pending_messages", []) + added}.values())
+    return candidates[:max_emails], {"history_id": hist["historyId"], "pending": candidates[max_emails:]}
+
+def save_cursor(cursor, retry):
+    # 処理が終わってから historyId と持ち越し分を保存する（retry は次回もう一度処理するメール）
+    pending = list({m["id"]: m for m in retry + cursor["pending"]}.values())
+    save_state("pending_messages", pending)
+    save_state("last_history_id", cursor["history_id"])
 
 def process_emails(max_emails, enable_filter, reply_subject, reply_body, pdf_bytes, pdf_filename):
     if not os.path.exists("token.json"):
         st.error("token.jsonなし")
         return
 
-    creds = Credentials.from_authorized_user_file("token.json")
-    service = build("gmail", "v1", credentials=creds)
+    # サービス（の httplib2 接続）は全セッションで共有されスレッドセーフでないため、処理全体を排他する
+    with get_gmail_lock():
+        _process_emails(max_emails, enable_filter, reply_subject, reply_body, pdf_bytes, pdf_filename)
+
+def _process_emails(max_emails, enable_filter, reply_subject, reply_body, pdf_bytes, pdf_filename):
+    service = get_gmail_service()
     groq_client = init_groq()
 
+    # ここで return した場合はカーソルを保存しないので、次回同じメールをもう一度取得する
     try:
-        results = service.users().messages().list(userId="me", q="is:unread", maxResults=max_emails).execute()
-        messages = results.get("messages", [])
+        messages, cursor = list_new_messages(service, max_emails)
     except Exception as e:
         st.error(f"Gmailエラー: {e}")
         return
 
     if not messages:
+        save_cursor(cursor, [])
         return
 
+    # フィルタ有効時はまずヘッダーだけ取得し、本文は除外されなかったメールだけ後で取得
+    if enable_filter:
+        fetch_kwargs = {"format": "metadata", "metadataHeaders": ["From", "Subject", "Message-ID"]}
+    else:
+        fetch_kwargs = {"format": "full"}
+
+    try:
+        fetched = batch_get_messages(service, [m["id"] for m in messages], **fetch_kwargs)
+    except Exception as e:
+        st.error(f"Gmailエラー: {e}")
+        return
+
+    to_mark_read_spam = []
+    to_mark_read_processed = []
+    done = set()  # 既読化できた・対象外・削除済みのID（それ以外は次回に再処理）
+    rows = []     # ログ用 (msg_id, from_addr, subject)：元の順番を保持
+    statuses = {}
+    targets = []  # 返信対象 (msg_id, thread_id, payload, from_addr, subject, message_id)
+
     for m in messages:
-        msg_data = service.users().messages().get(userId="me", id=m["id"]).execute()
+        msg_data, err = fetched.get(m["id"], (None, None))
+        if err or not msg_data:
+            rows.append((m["id"], "", ""))
+            statuses[m["id"]] = f"Error: {err}"
+            if getattr(getattr(err, "resp", None), "status", None) == 404:
+                done.add(m["id"])
+            continue
+        # 差分取得後にすでに読まれた・迷惑メール/ゴミ箱に移ったメールは対象外
+        labels = msg_data.get("labelIds", [])
+        if "UNREAD" not in labels or "SPAM" in labels or "TRASH" in labels:
+            done.add(m["id"])
+            continue
         payload = msg_data["payload"]
         headers = payload["headers"]
 
-        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "No Subject")
-        from_addr = next((h["value"] for h in headers if h["name"] == "From"), "Unknown")
-        message_id = next((h["value"] for h in headers if h["name"] == "Message-ID"), "")
+        hdrs = {h["name"]: h["value"] for h in reversed(headers)}  # 重複時は先頭を優先
+        subject = hdrs.get("Subject", "No Subject")
+        from_addr = hdrs.get("From", "Unknown")
+        message_id = hdrs.get("Message-ID", "")
+
+        rows.append((m["id"], from_addr, subject))
 
-        status = "Processed"
-        ignore_keywords = ["no-reply", "noreply", "mailer-daemon", "google", "amazon", "rakuten", "unknown"]
-        is_spam = any(k in from_addr.lower() for k in ignore_keywords)
+        is_spam = bool(SPAM_RE.search(from_addr))
 
         if enable_filter and is_spam:
-            status = "Skipped"
-            service.users().messages().modify(userId='me', id=m["id"], body={"removeLabelIds": ["UNREAD"]}).execute()
+            statuses[m["id"]] = "Skipped"
+            to_mark_read_spam.append(m["id"])
         else:
-            body = get_body(payload)
-            summary = summarize(body, groq_client)
-            
-            line_push_message(f"📩 受信: {subject}\n\n{summary}")
-            
+            targets.append((m["id"], m["threadId"], payload, from_addr, subject, message_id))
+
+    if enable_filter and targets:
+        try:
+            full = batch_get_messages(service, [t[0] for t in targets], format="full")
+        except Exception as e:
+            # 取得できなかった分はエラーとして記録し、ログ出力と既読化は続ける
+            st.error(f"Gmailエラー: {e}")
+            full = {t[0]: (None, e) for t in targets}
+        full_targets = []
+        for t in targets:
+            msg_data, err = full.get(t[0], (None, None))
+            if err or not msg_data:
+                statuses[t[0]] = f"Error: {err}"
+                continue
+            full_targets.append((t[0], t[1], msg_data["payload"]) + t[3:])
+        targets = full_targets
+
+    # 要約・LINE通知・返信送信はスレッドで並列実行
+    # （Gmail送信はプールから借りた接続を使い、次回の実行でも再利用する）
+    http_pool = get_gmail_http_pool()
+    ctx = get_script_run_ctx()
+
+    pdf_part = create_pdf_part(pdf_bytes, pdf_filename)
+
+    def send_one(t):
+        msg_id, thread_id, _, from_addr, subject, message_id = t
+        try:
+            reply = create_reply(from_addr, subject, thread_id, message_id, reply_subject, reply_body, pdf_part)
             try:
-                reply = create_reply(from_addr, subject, m["threadId"], message_id, reply_subject, reply_body, pdf_bytes, pdf_filename)
-                service.users().messages().send(userId="me", body=reply).execute()
-                status = "Replied"
-                st.session_state.reply_count += 1
-            except Exception as e:
-                status = f"Error: {str(e)}"
+                http = http_pool.get_nowait()
+            except queue.Empty:
+                http = new_gmail_http()
+            try:
+                service.users().messages().send(userId="me", body=reply).execute(http=http)
+            finally:
+                http_pool.put(http)
+            return "Replied"
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    # 以前の実行で処理済み（既読化に失敗したもの等）は重複通知せず既読化だけ行う
+    fresh_targets = []
+    for t in targets:
+        if mark_seen(t[0]):
+            fresh_targets.append(t)
+        else:
+            statuses[t[0]] = "Duplicate"
+            to_mark_read_processed.append(t[0])
+    targets = fresh_targets
 
-            service.users().messages().modify(userId='me', id=m["id"], body={"removeLabelIds": ["UNREAD"]}).execute()
+    if targets:
+        with ThreadPoolExecutor(max_workers=8, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+            summaries = list(executor.map(lambda t: summarize(get_body(t[2]), groq_client), targets))
 
+            # LINE通知は5件ずつまとめて送信
+            pending_notifications = [f"📩 受信: {t[4]}\n\n{summary}" for t, summary in zip(targets, summaries)]
+            chunks = [pending_notifications[i:i + 5] for i in range(0, len(pending_notifications), 5)]
+            pushes = executor.map(line_push_batch, chunks)
+
+            results = list(executor.map(send_one, targets))
+            list(pushes)
+
+        for t, status in zip(targets, results):
+            statuses[t[0]] = status
+            to_mark_read_processed.append(t[0])
+        add_reply_count(results.count("Replied"))
+
+    for msg_id, from_addr, subject in rows:
         log_entry = {
             "Time": datetime.now().strftime("%H:%M"),
             "From": from_addr,
             "Subject": subject,
-            "Status": status
+            "Status": statuses[msg_id]
         }
-        st.session_state.log_data.insert(0, log_entry)
+        add_log(log_entry)
+
+    # 既読化は batchModify でまとめて1回（1リクエスト最大1000件）
+    all_ids = to_mark_read_spam + to_mark_read_processed
+    for i in range(0, len(all_ids), 1000):
+        chunk = all_ids[i:i + 1000]
+        try:
+            service.users().messages().batchModify(userId="me", body={"ids": chunk, "removeLabelIds": ["UNREAD"]}).execute()
+            done.update(chunk)
+        except Exception as e:
+            for msg_id in chunk:
+                add_log({
+                    "Time": datetime.now().strftime("%H:%M"),
+                    "From": "",
+                    "Subject": msg_id,
+                    "Status": f"既読化エラー: {e}"
+                })
+
+    save_cursor(cursor, [m for m in messages if m["id"] not in done])
 
 # ==========================================
 # 🖥️ フロントエンド
@@ -228,7 +603,11 @@ st.title("📨 自動メール返信ツール")
 # --- サイドバー ---
 with st.sidebar:
     st.header("🛠️ 設定メニュー")
-    is_active = st.toggle("システム稼働スイッチ", value=False)
+    # 稼働状態も保存し、再起動後は前回の状態（と次回時刻）から再開する
+    is_active = st.toggle(
+        "システム稼働スイッチ", key="is_active",
+        on_change=lambda: save_state("is_active", st.session_state.is_active),
+    )
     
     st.divider()
     st.subheader("基本設定")
@@ -247,8 +626,8 @@ with st.sidebar:
 
     st.divider()
     if st.button("🗑️ ログリセット"):
-        st.session_state.reply_count = 0
-        st.session_state.log_data = []
+        save_state("reply_count", {"date": datetime.now().strftime("%Y-%m-%d"), "count": 0})
+        clear_log()
         st.rerun()
 
 # --- メインエリア ---
@@ -261,7 +640,7 @@ with col1:
     else:
         st.error("🔴 **停止中**")
 with col2:
-    st.metric("📅 本日の返信", f"{st.session_state.reply_count} 件")
+    st.metric("📅 本日の返信", f"{get_reply_count()} 件")
 
 st.divider()
 
@@ -270,8 +649,9 @@ tab1, tab2 = st.tabs(["📊 処理ログ", "⚙️ 返信 & PDF設定"])
 
 # --- タブ1: ログ ---
 with tab1:
+    sync_log()
     if st.session_state.log_data:
-        df = pd.DataFrame(st.session_state.log_data)
+        df = log_df()
         st.dataframe(df, use_container_width=True)
     else:
         st.info("履歴なし")
@@ -306,16 +686,32 @@ if is_active:
         with st.spinner(f'チェック中...'):
             process_emails(max_emails, enable_filter, reply_subject, reply_body, pdf_bytes, pdf_filename)
         
-        st.session_state.next_run_time = now + timedelta(minutes=check_interval)
+        save_next_run_time(now + timedelta(minutes=check_interval))
         st.rerun()
     else:
         remaining = st.session_state.next_run_time - now
         secs_left = int(remaining.total_seconds())
-        st.caption(f"⏳ 次回チェックまで: {secs_left} 秒")
-        time.sleep(1)
-        st.rerun()
+        # 毎秒の再実行はせず、カウントダウン表示はブラウザ側で更新する
+        components.html(f"""
+            <span id="c" style="font-family: sans-serif; font-size: 14px; color: rgba(128, 128, 128, 0.9);"></span>
+            <script>
+                let s = {secs_left};
+                const el = document.getElementById("c");
+                const render = () => {{ el.textContent = `⏳ 次回チェックまで: ${{s}} 秒`; }};
+                render();
+                setInterval(() => {{ s = Math.max(0, s - 1); render(); }}, 1000);
+            </script>
+        """, height=30)
+        # 次回チェック時刻に再実行する。st_autorefresh は count < limit の間だけ更新を送るため、
+        # 1回だけ更新させるには limit=2 を指定する（キーは予定時刻ごとに変え、毎回タイマーを作り直す）
+        st_autorefresh(
+            interval=int(remaining.total_seconds() * 1000) + 500,
+            limit=2,
+            key=f"tick_{st.session_state.next_run_time.timestamp()}",
+        )
 else:
-    st.session_state.next_run_time = None
+    if st.session_state.next_run_time is not None:
+        save_next_run_time(None)
 
 
 
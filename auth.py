@@ -1,20 +1,40 @@
-import os
-from google_auth_oauthlib.flow import InstalledAppFlow
+import errno
+import socket
+from private_file import write_private
 
 # Gmailを読み書きする権限の設定
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 
+# 認証のリダイレクトを受けるローカルポート
+AUTH_PORT = 8765
+
+def pick_port():
+    # 固定ポートが使用中なら 0（OSに空きポートを選ばせる）を返す
+    # google-auth-oauthlib は他プロセスにコールバックを横取りされないよう、あえて
+    # allow_reuse_address=False でサーバーを立てるので、ここでも SO_REUSEADDR は付けない
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind(('127.0.0.1', AUTH_PORT))
+        except OSError as e:
+            if e.errno != errno.EADDRINUSE:
+                raise
+            return 0
+    return AUTH_PORT
+
 def main():
+    # google_auth_oauthlib は読み込みが重いので、実行時に import する
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     # 認証フローを開始
     flow = InstalledAppFlow.from_client_secrets_file(
         'credentials.json', SCOPES)
     
-    # ブラウザを立ち上げて認証する
-    creds = flow.run_local_server(port=0)
+    # ブラウザを立ち上げて認証する（固定ポートが使えないときは空いているポートで）
+    creds = flow.run_local_server(port=pick_port(), bind_addr='127.0.0.1', open_browser=True)
     
     # 結果を token.json に保存
-    with open('token.json', 'w') as token:
-        token.write(creds.to_json())
+    # （to_json は辞書を作って1回 json.dumps するだけ。形式は from_authorized_user_file と対になるのでそのまま使う）
+    write_private('token.json', creds.to_json().encode())
     print("成功です！ token.json が作成されました。")
 
 if __name__ == '__main__':
@@ -1,34 +1,113 @@
-import os
-from dotenv import load_dotenv
-
-# 今のフォルダにあるファイルを全部表示する
-print("📂 今のフォルダにあるファイル一覧:")
-files = os.listdir('.')
-print(files)
-
-print("-" * 20)
-
-# .envがあるかチェック
-if ".env" in files:
-    print("✅ .env ファイルは見つかりました！")
-    
-    # 中身を読み込んでみる
-    load_dotenv()
-    token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
-    user_id = os.getenv("LINE_USER_ID")
-    
-    if token:
-        print(f"🆗 トークン読み込み成功: {token[:10]}...") # 最初の10文字だけ表示
-    else:
-        print("❌ トークンが読み込めません（中身の書き方が間違っています）")
-        
-    if user_id:
-        print(f"🆗 ID読み込み成功: {user_id}")
-    else:
-        print("❌ User IDが読み込めません")
-
-elif ".env.txt" in files:
-    print("😱 ファイル名が惜しい！ '.env.txt' になっています。名前の変更で '.txt' を消してください。")
-
-else:
-    print("❌ '.env' が見つかりません。保存場所が違うか、名前が間違っています。")
\ No newline at end of file
+import sys
+import mmap
+import importlib.util
+import functools
+from pathlib import Path
+
+# チェックする環境変数
+REQUIRED = ("LINE_CHANNEL_ACCESS_TOKEN", "LINE_USER_ID")
+
+# 表示するメッセージ
+MSG_LISTING = "📂 今のフォルダにあるファイル一覧:"
+MSG_FOUND = "✅ .env ファイルは見つかりました！"
+MSG_TOKEN_OK = "🆗 トークン読み込み成功: %s..."
+MSG_TOKEN_NG = "❌ トークンが読み込めません（中身の書き方が間違っています）"
+MSG_ID_OK = "🆗 ID読み込み成功: %s"
+MSG_ID_NG = "❌ User IDが読み込めません"
+MSG_ENV_TXT = "😱 ファイル名が惜しい！ '.env.txt' になっています。名前の変更で '.txt' を消してください。"
+MSG_MISSING = "❌ '.env' が見つかりません。保存場所が違うか、名前が間違っています。"
+SEPARATOR = "-" * 20
+
+# 各変数の表示（成功時の書式, 表示する文字数 ※Noneは全部, 失敗時のメッセージ）
+REPORT = {
+    "LINE_CHANNEL_ACCESS_TOKEN": (MSG_TOKEN_OK, 10, MSG_TOKEN_NG), # 最初の10文字だけ表示
+    "LINE_USER_ID": (MSG_ID_OK, None, MSG_ID_NG),
+}
+
+# KEY=VALUE だけの単純な .env を読む（python-dotenv の正規表現パーサーより軽い）
+# ファイルは mmap で読み、バッファへのコピーを省く
+def _parse(path):
+    env = {}
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空ファイルは mmap できない
+            return env
+        with mm:
+            for line in iter(mm.readline, b''):
+                line = line.strip()
+                if not line or line.startswith(b'#'):
+                    continue
+                if line.startswith(b'export '):
+                    line = line[len(b'export '):]
+                key, _, value = line.partition(b'=')
+                value = value.strip()
+                if value[:1] in (b'"', b"'"):
+                    # 引用符で囲まれた値は閉じ引用符まで（後ろのコメントは無視）
+                    end = value.find(value[:1], 1)
+                    value = value[1:end] if end != -1 else value[1:]
+                else:
+                    # 引用符なしの値は " #" 以降をコメントとして除く
+                    value = value.split(b' #', 1)[0].rstrip()
+                env[key.strip().decode('utf-8')] = value.decode('utf-8')
+    return env
+
+# .env は更新されるまで読み込み結果を使い回す（強制的に読み直すときは _env.cache_clear()）
+# compile_env.py で作った _env_compiled.py が最新ならそちらを使う
+# （sys.modules は通さずにファイルから import するので、作り直した内容が必ず反映される。
+#   バイトコードは __pycache__ のハッシュ検証付き .pyc が使われる）
+@functools.lru_cache(maxsize=1)
+def _load(mtime_ns):
+    compiled = Path('_env_compiled.py')
+    try:
+        if mtime_ns <= compiled.stat().st_mtime_ns:
+            spec = importlib.util.spec_from_file_location('_env_compiled', compiled)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module.ENV
+    except (OSError, AttributeError, SyntaxError):
+        pass
+    return _parse('.env')
+
+def _env():
+    return _load(Path('.env').stat().st_mtime_ns)
+
+_env.cache_clear = _load.cache_clear
+
+def _quiet(*args, **kwargs):
+    pass
+
+def check(verbose=True):
+    """.env の状態を確認し、必要な値がすべてそろっていれば True を返す"""
+    log = print if verbose else _quiet
+
+    # 今のフォルダにあるファイルを全部表示する（python -O での実行時や、ターミナル以外への出力時は省略）
+    if verbose and __debug__ and sys.stdout.isatty():
+        log(MSG_LISTING)
+        log(*(p.name for p in Path('.').iterdir()), sep='\n')
+
+    log(SEPARATOR)
+
+    # .envを読み込んでみる（無ければ FileNotFoundError）
+    try:
+        env = _env()
+    except FileNotFoundError:
+        if Path('.env.txt').is_file():
+            log(MSG_ENV_TXT)
+        else:
+            log(MSG_MISSING)
+        return False
+
+    log(MSG_FOUND)
+    present = [k for k in REQUIRED if env.get(k)]
+    missing = [k for k in REQUIRED if not env.get(k)]
+    if present:
+        log("\n".join(REPORT[k][0] % env[k][:REPORT[k][1]] for k in present))
+    if missing:
+        log("\n".join(REPORT[k][2] for k in missing))
+    return not missing
+
+if __name__ == '__main__':
+    # --quiet を付けると何も表示せず、結果は終了コードで返す
+    ok = check(verbose='--quiet' not in sys.argv)
+    sys.exit(0 if ok else 1)
\ No newline at end of file
@@ -0,0 +1,31 @@
+import os
+import sys
+import py_compile
+from check_env import _parse
+from private_file import write_private
+
+# .env を Python の辞書リテラルに変換して _env_compiled.py に書き出す
+# （check_env.py はキャッシュ済みバイトコードを import するだけで済み、毎回 .env を解析しなくてよくなる）
+SRC = '.env'
+DST = '_env_compiled.py'
+
+def main():
+    if not os.path.isfile(SRC):
+        print(f"❌ '{SRC}' が見つかりません。{DST} は作成しませんでした。")
+        sys.exit(1)
+
+    # .env が更新されていなければ作り直さない
+    if os.path.exists(DST) and os.path.getmtime(SRC) <= os.path.getmtime(DST):
+        print(f"✅ {DST} は最新です")
+        return
+
+    # check_env.py の読み込みと結果が食い違わないよう、同じパーサーを使う
+    env = _parse(SRC)
+    write_private(DST, f"ENV = {env!r}\n".encode('utf-8'))
+    # バイトコードも作っておく。ハッシュ検証方式なので同じ秒に作り直しても古い .pyc は使われない
+    # （.pyc の権限は元ファイルと同じ 0600 になる）
+    py_compile.compile(DST, invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH)
+    print(f"成功です！ {DST} が作成されました。")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,15 @@
+import os
+
+def write_private(dst, data):
+    # 秘密情報のファイルを 0600 で作り、一時ファイルから置き換える（途中で落ちても dst が壊れない）
+    tmp = dst + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    os.replace(tmp, dst)
\ No newline at end of file